@@ -0,0 +1,16 @@
+"""
+Gunicorn settings for the webhook app, loaded from the working directory.
+"""
+
+
+def post_worker_init(worker):  # pylint: disable=unused-argument
+    """
+    Creates the shared engine when a worker starts, so a missing DB_URL fails
+    the deploy instead of the first webhook. Importing the app does not need
+    a database.
+    """
+    # Imported here so the config can be read before the app is on the path
+    # pylint: disable=import-outside-toplevel
+    from dynamic_pricing.core.db_utils import get_engine
+
+    get_engine()
@@ -3,6 +3,7 @@ This module is responsible for initializing the database schema for the dynamic
 It creates necessary tables and sets up relationships between them.
 """
 
+import argparse
 import os
 import sqlalchemy as sqla
 from dotenv import load_dotenv
@@ -35,7 +36,7 @@ def create_tables(connection: sqla.engine.base.Connection) -> None:
             """CREATE TABLE customers (
                 customer_id SERIAL PRIMARY KEY,
                 first_name VARCHAR(255),
-                contact_number VARCHAR(20) NOT NULL,
+                contact_number VARCHAR(20) UNIQUE NOT NULL,
                 contact_access_code VARCHAR(20)
                );"""
         )
@@ -64,7 +65,7 @@ def create_tables(connection: sqla.engine.base.Connection) -> None:
             """CREATE TABLE modifiers (
                 modifier_id SERIAL PRIMARY KEY,
                 platform_modifier_id VARCHAR(255) NOT NULL,
-                modifier_name VARCHAR(255) NOT NULL,
+                modifier_name VARCHAR(255) UNIQUE NOT NULL,
                 modifier_operational_name VARCHAR(255) NOT NULL,
                 modifier_fractional_cost INT
                );"""
@@ -77,7 +78,7 @@ def create_tables(connection: sqla.engine.base.Connection) -> None:
             """CREATE TABLE items (
                 item_id SERIAL PRIMARY KEY,
                 platform_item_id VARCHAR(255) NOT NULL,
-                item_name VARCHAR(255) NOT NULL,
+                item_name VARCHAR(255) UNIQUE NOT NULL,
                 item_operational_name VARCHAR(255) NOT NULL,
                 item_fractional_cost INT
                );"""
@@ -102,7 +103,8 @@ def create_tables(connection: sqla.engine.base.Connection) -> None:
                 partner_id INT NOT NULL,
                 CONSTRAINT fk_orders_partner_id FOREIGN KEY (partner_id)
                     REFERENCES partners(partner_id) ON DELETE SET NULL
-               );"""
+               );
+               CREATE INDEX orders_partner_id_idx ON orders (partner_id);"""
         )
     )
 
@@ -145,9 +147,41 @@ def create_tables(connection: sqla.engine.base.Connection) -> None:
     connection.commit()
 
 
+def add_missing_indexes(connection: sqla.engine.base.Connection) -> None:
+    """Add the indexes that the upserts and order loading rely on to an
+    existing database created before they were part of the schema."""
+    connection.execute(
+        text(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS customers_contact_number_key
+                ON customers (contact_number);
+            CREATE UNIQUE INDEX IF NOT EXISTS items_item_name_key
+                ON items (item_name);
+            CREATE UNIQUE INDEX IF NOT EXISTS modifiers_modifier_name_key
+                ON modifiers (modifier_name);
+            CREATE INDEX IF NOT EXISTS orders_partner_id_idx
+                ON orders (partner_id);
+            """
+        )
+    )
+    connection.commit()
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Initialize the dynamic pricing database."
+    )
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="only add missing indexes to an existing database",
+    )
+    args = parser.parse_args()
     try:
         with get_db_connection() as connection:
-            create_tables(connection)
+            if args.migrate:
+                add_missing_indexes(connection)
+            else:
+                create_tables(connection)
     except sqla.exc.SQLAlchemyError as e:
         print(f"Error: {e}")
@@ -1,94 +1,422 @@
 """
 This module handles database operations necessary for managing dynamic pricing data.
-It includes functions to establish database connections, create temporary tables,
+It includes functions to establish database connections, stage rows in temporary tables,
 perform upsert operations, and load data, among other utility functions.
 """
 
+import functools
+import io
+import itertools
+import json
+import logging
 import os
-from typing import List
+from typing import Iterator, List, Union
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 import sqlalchemy as sqla
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 
 load_dotenv()
 
+COPY_THRESHOLD = 500  # Rows above which bulk upserts are staged with COPY
+ECHO_SAMPLE_RATE = 100  # Log one in this many statements when DB_ECHO is set
+
+# Text columns of load_order_data, which could otherwise be parsed as numbers
+ORDER_DATA_STRING_COLUMNS = (
+    "platform_order_id",
+    "order_status",
+    "first_name",
+    "contact_number",
+    "contact_access_code",
+    "partner_name",
+    "platform_item_id",
+    "item_name",
+    "item_operational_name",
+    "platform_modifier_id",
+    "modifier_name",
+    "modifier_operational_name",
+)
+
+# Flattened order data, one row per order item modifier
+ORDER_DATA_SELECT = (
+    "SELECT orders.order_id, orders.platform_order_id, orders.platform_order_number, orders.order_status, "  # pylint: disable=line-too-long
+    "orders.order_placed_timestamp, orders.order_updated_timestamp, orders.order_prepare_for_timestamp, "  # pylint: disable=line-too-long
+    "orders.order_start_prepping_at_timestamp, customers.customer_id, customers.first_name, "  # pylint: disable=line-too-long
+    "customers.contact_number, customers.contact_access_code, partners.partner_id, partners.partner_name, "  # pylint: disable=line-too-long
+    "items.item_id, items.platform_item_id, items.item_name, items.item_operational_name, items.item_fractional_cost, "  # pylint: disable=line-too-long
+    "order_items.quantity AS item_quantity, order_items.fractional_price AS item_fractional_price, "  # pylint: disable=line-too-long
+    "modifiers.modifier_id, modifiers.platform_modifier_id, modifiers.modifier_name, "  # pylint: disable=line-too-long
+    "modifiers.modifier_operational_name, order_item_modifiers.quantity AS modifier_quantity, "  # pylint: disable=line-too-long
+    "order_item_modifiers.fractional_price AS modifier_fractional_price "  # pylint: disable=line-too-long
+    "FROM partners JOIN orders ON orders.partner_id = partners.partner_id "  # pylint: disable=line-too-long
+    "LEFT JOIN customers ON orders.customer_id = customers.customer_id "  # pylint: disable=line-too-long
+    "LEFT JOIN order_items ON orders.order_id = order_items.order_id LEFT JOIN items ON order_items.item_id = items.item_id "  # pylint: disable=line-too-long
+    "LEFT JOIN order_item_modifiers ON order_items.order_id = order_item_modifiers.order_id "  # pylint: disable=line-too-long
+    "AND order_items.item_id = order_item_modifiers.item_id LEFT JOIN modifiers ON order_item_modifiers.modifier_id = modifiers.modifier_id "  # pylint: disable=line-too-long
+)
+
+# Flattened order data of a partner
+ORDER_DATA_QUERY = text(
+    f"{ORDER_DATA_SELECT} WHERE partners.partner_name = :partner_name"
+)
+
+
+# SQLAlchemy's own statement logging formats every statement and its
+# parameters, so it stays off. With DB_ECHO set, one in ECHO_SAMPLE_RATE
+# statements is logged together with its parameters instead. The sample does
+# not propagate, or the root handlers would log it twice.
+logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+echo_logger = logging.getLogger(f"{__name__}.echo")
+echo_counter = itertools.count()
+
+
+def _echo_statement(  # pylint: disable=too-many-arguments,unused-argument
+    conn, cursor, statement, parameters, context, executemany
+):
+    """
+    Logs every ECHO_SAMPLE_RATE-th statement sent to the database, on a single
+    line with its parameters.
+    """
+    if next(echo_counter) % ECHO_SAMPLE_RATE == 0:
+        echo_logger.info("%s %r", statement, parameters)
+
+
+if os.environ.get("DB_ECHO", "").strip().lower() in ("1", "true", "yes", "on"):
+    echo_logger.addHandler(logging.StreamHandler())
+    echo_logger.setLevel(logging.INFO)
+    echo_logger.propagate = False
+    sqla.event.listen(
+        sqla.engine.Engine, "before_cursor_execute", _echo_statement
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_engine() -> sqla.engine.Engine:
+    """
+    Returns the process-wide engine for the URL from environment variables, so
+    every connection is checked out of the same connection pool. The engine is
+    created on first use rather than at import.
+    """
+    db_url = os.environ.get("DB_URL")
+    if not db_url:
+        raise ValueError("DB_URL environment variable is not set.")
+    # The executemany modes only exist in the psycopg2 dialect, while a
+    # postgresql+psycopg:// URL selects psycopg 3
+    driver_options = (
+        {
+            "executemany_mode": "values_plus_batch",
+            "executemany_batch_page_size": 500,
+        }
+        if sqla.engine.make_url(db_url).get_driver_name() == "psycopg2"
+        else {}
+    )
+    return create_engine(
+        db_url,
+        echo=False,
+        pool_size=16,
+        max_overflow=32,
+        pool_recycle=1800,
+        pool_pre_ping=False,
+        insertmanyvalues_page_size=1000,
+        query_cache_size=1200,
+        **driver_options,
+    )
+
 
 def get_db_connection():
     """
     Establishes and returns a database connection using the URL from environment variables.
     """
-    db_url = os.environ.get("DB_URL")
-    assert db_url, "DB_URL environment variable is not set."
-    engine = create_engine(db_url, echo=True)
-    return engine.connect()
+    return get_engine().connect()
+
+
+def _copy_value(value) -> str:
+    """Formats a value for the text format of COPY, where NULL is \\N."""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(
+    conn: sqla.engine.base.Connection, table_name: str, rows: List[dict]
+):
+    """
+    Loads rows into a table with COPY ... FROM STDIN, which streams all rows
+    to the server in a single round trip.
+    """
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(row[col]) for col in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    statement = f"COPY {table_name} ({', '.join(columns)}) FROM STDIN"
+    cursor = conn.connection.cursor()
+    try:
+        if conn.dialect.driver == "psycopg":
+            with cursor.copy(statement) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            cursor.copy_expert(statement, buffer)
+    except conn.dialect.loaded_dbapi.Error as e:
+        raise ConnectionError(
+            f"Error copying rows into table {table_name}: {e}"
+        ) from e
+    finally:
+        cursor.close()
 
 
 def create_tmp_table(
-    conn: sqla.engine.base.Connection, table_name: str, data_dict: dict
+    conn: sqla.engine.base.Connection, table_name: str, rows: List[dict]
 ) -> str:
     """
-    Creates a temporary table based on an existing table's schema and inserts initial data.
+    Creates a session-local temporary table with the columns of an existing table,
+    if it does not exist yet in this transaction, and loads the rows into it with COPY.
+    The table is dropped by Postgres when the transaction commits.
     """
     try:
-        conn.execute(text(f"DROP TABLE IF EXISTS tmp_{table_name} CASCADE;"))
         conn.execute(
             text(
-                f"CREATE TABLE tmp_{table_name} (LIKE {table_name} INCLUDING ALL);"
+                f"CREATE TEMP TABLE IF NOT EXISTS tmp_{table_name} ON COMMIT DROP AS SELECT * FROM {table_name} WITH NO DATA;"  # pylint: disable=line-too-long
             )
         )
-        insert_query = f"INSERT INTO tmp_{table_name} ({', '.join(data_dict.keys())}) VALUES ({', '.join([':' + col for col in data_dict.keys()])})"  # pylint: disable=line-too-long
-        conn.execute(text(insert_query), data_dict)
     except sqla.exc.SQLAlchemyError as e:
         raise ConnectionError(
             f"Error creating temporary table for {table_name}: {e}"
         ) from e
+    copy_rows(conn, f"tmp_{table_name}", rows)
     return f"tmp_{table_name}"
 
 
-def drop_tmp_table(conn: sqla.engine.base.Connection, tmp_table_name: str):
+def _on_conflict_clause(
+    table_name: str,
+    columns: tuple,
+    pk_cols: tuple,
+) -> str:
     """
-    Drops a specified temporary table.
+    Builds the ON CONFLICT ... DO UPDATE clause shared by the upsert statements.
+    The pk_cols must be covered by a primary key or unique constraint of the table.
+    Rows whose values are unchanged are skipped instead of rewritten, so they are
+    not returned by RETURNING.
     """
-    try:
-        conn.execute(text(f"DROP TABLE IF EXISTS {tmp_table_name} CASCADE;"))
-    except sqla.exc.SQLAlchemyError as e:
-        raise ConnectionError(
-            f"Error dropping temporary table {tmp_table_name}: {e}"
-        ) from e
+    update_cols = [col for col in columns if col not in pk_cols]
+    conflict_cols = [f"{col}=EXCLUDED.{col}" for col in update_cols]
+    current_values = [f"{table_name}.{col}" for col in update_cols]
+    new_values = [f"EXCLUDED.{col}" for col in update_cols]
+    return (
+        f"ON CONFLICT ({', '.join(pk_cols)}) DO UPDATE SET {', '.join(conflict_cols)} "  # pylint: disable=line-too-long
+        f"WHERE ({', '.join(current_values)}) IS DISTINCT FROM ({', '.join(new_values)})"  # pylint: disable=line-too-long
+    )
 
 
-def add_constraints(
-    conn: sqla.engine.base.Connection, table_name: str, pk_cols: List[str]
+def _returning_select(
+    table_name: str, pk_cols: tuple, returning_cols: tuple, submitted: str
+) -> str:
+    """
+    Builds the query returning the rows written by the 'merged' upsert along with
+    the unchanged rows it skipped, which are looked up in the table through the
+    submitted condition on their keys.
+    """
+    merged_pk = " AND ".join(
+        f"merged.{col} = {table_name}.{col}" for col in pk_cols
+    )
+    return (
+        f"SELECT {', '.join(returning_cols)} FROM merged UNION ALL "
+        f"SELECT {', '.join(f'{table_name}.{col}' for col in returning_cols)} FROM {table_name} "  # pylint: disable=line-too-long
+        f"WHERE {submitted} AND NOT EXISTS (SELECT 1 FROM merged WHERE {merged_pk});"  # pylint: disable=line-too-long
+    )
+
+
+# The statements only depend on the table and column layout, so they are
+# built once per layout and the same TextClause is reused, which also keeps
+# SQLAlchemy's compiled statement cache warm.
+@functools.lru_cache(maxsize=None)
+def _merge_statement(
+    table_name: str,
+    tmp_table_name: str,
+    columns: tuple,
+    pk_cols: tuple,
+    returning_cols: tuple = None,
+) -> sqla.TextClause:
+    """
+    Builds the statement merging a staging table into its target table.
+    """
+    # Deleting the staged rows as they are merged leaves the temporary
+    # table empty for the next batch in the same transaction
+    staged = f"WITH staged AS (DELETE FROM {tmp_table_name} RETURNING {', '.join(columns)})"  # pylint: disable=line-too-long
+    insert = (
+        f"INSERT INTO {table_name} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM staged ORDER BY {', '.join(pk_cols)} "  # pylint: disable=line-too-long
+        + _on_conflict_clause(table_name, columns, pk_cols)
+    )
+    if not returning_cols:
+        return text(f"{staged} {insert};")
+    merged_cols = tuple(dict.fromkeys(pk_cols + returning_cols))
+    return text(
+        f"{staged}, merged AS ({insert} RETURNING {', '.join(merged_cols)}) "
+        + _returning_select(
+            table_name,
+            pk_cols,
+            returning_cols,
+            f"({', '.join(pk_cols)}) IN (SELECT {', '.join(pk_cols)} FROM staged)",  # pylint: disable=line-too-long
+        )
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _upsert_statement(
+    table_name: str,
+    columns: tuple,
+    pk_cols: tuple,
+    returning_cols: tuple = None,
+) -> sqla.TextClause:
+    """
+    Builds the statement upserting a single row into a table.
+    """
+    insert = (
+        f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join([':' + col for col in columns])}) "  # pylint: disable=line-too-long
+        + _on_conflict_clause(table_name, columns, pk_cols)
+    )
+    if not returning_cols:
+        return text(f"{insert};")
+    merged_cols = tuple(dict.fromkeys(pk_cols + returning_cols))
+    return text(
+        f"WITH merged AS ({insert} RETURNING {', '.join(merged_cols)}) "
+        + _returning_select(
+            table_name,
+            pk_cols,
+            returning_cols,
+            " AND ".join(f"{col} = :{col}" for col in pk_cols),
+        )
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _values_statement(
+    table_name: str,
+    columns: tuple,
+    pk_cols: tuple,
+    returning_cols: tuple = None,
+) -> sqla.TextClause:
+    """
+    Builds the statement upserting a batch of rows into a table. The rows are
+    bound as one JSON array in :rows and expanded into the row type of the
+    table by json_populate_recordset, so the same statement serves batches
+    of any size.
+    """
+    submitted = f"WITH submitted AS (SELECT {', '.join(columns)} FROM json_populate_recordset(NULL::{table_name}, CAST(:rows AS json)))"  # pylint: disable=line-too-long
+    insert = (
+        f"INSERT INTO {table_name} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM submitted "  # pylint: disable=line-too-long
+        + _on_conflict_clause(table_name, columns, pk_cols)
+    )
+    if not returning_cols:
+        return text(f"{submitted} {insert};")
+    merged_cols = tuple(dict.fromkeys(pk_cols + returning_cols))
+    return text(
+        f"{submitted}, merged AS ({insert} RETURNING {', '.join(merged_cols)}) "  # pylint: disable=line-too-long
+        + _returning_select(
+            table_name,
+            pk_cols,
+            returning_cols,
+            f"({', '.join(pk_cols)}) IN (SELECT {', '.join(pk_cols)} FROM submitted)",  # pylint: disable=line-too-long
+        )
+    )
+
+
+def bulk_upsert(
+    conn: sqla.engine.base.Connection,
+    table_name: str,
+    rows: List[dict],
+    pk_cols: List[str],
+    returning_cols: List[str] = None,
 ):
     """
-    Adds unique constraints to a table based on specified primary key columns.
+    Performs an upsert of many rows at once with a single INSERT ... ON CONFLICT
+    statement. Batches of up to COPY_THRESHOLD rows are sent as one JSON array
+    parameter, larger ones are copied into a temporary table and merged from it.
+    Returns the returned rows if returning_cols is given, otherwise the number of
+    affected rows. Raises ConnectionError if rows are still missing from the
+    returned rows after a rerun.
     """
+    if not rows:
+        return [] if returning_cols else 0
+    # ON CONFLICT cannot touch the same row twice in one statement, so keep
+    # only the last row for each key. Writing rows in key order makes
+    # concurrent batches lock shared rows in the same order, which avoids
+    # deadlocks between them.
+    rows = [
+        row
+        for _, row in sorted(
+            {tuple(row[col] for col in pk_cols): row for row in rows}.items(),
+            key=lambda item: item[0],
+        )
+    ]
+    returning_cols = tuple(returning_cols) if returning_cols else None
     try:
-        conn.execute(
-            text(
-                f"ALTER TABLE {table_name} ADD CONSTRAINT temp_constraint UNIQUE ({', '.join(pk_cols)});"  # pylint: disable=line-too-long
-            )
+        cursor = _execute_bulk_upsert(
+            conn, table_name, rows, tuple(pk_cols), returning_cols
         )
+        if not returning_cols:
+            return cursor.rowcount
+        result = cursor.fetchall()
+        if len(result) < len(rows):
+            # Unchanged rows committed by a concurrent transaction after the
+            # statement started are skipped but not visible to it, so run it
+            # again with a fresh snapshot to return them
+            result = _execute_bulk_upsert(
+                conn,
+                table_name,
+                rows,
+                tuple(pk_cols),
+                returning_cols,
+            ).fetchall()
     except sqla.exc.SQLAlchemyError as e:
         raise ConnectionError(
-            f"Error adding constraints to table {table_name}: {e}"
+            f"Error upserting data into table {table_name}: {e}"
         ) from e
+    if len(result) < len(rows):
+        raise ConnectionError(
+            f"Error upserting data into table {table_name}: "
+            f"{len(rows) - len(result)} rows were not returned"
+        )
+    return result
 
 
-def remove_constraints(conn: sqla.engine.base.Connection, table_name: str):
+def _execute_bulk_upsert(
+    conn: sqla.engine.base.Connection,
+    table_name: str,
+    rows: List[dict],
+    pk_cols: tuple,
+    returning_cols: tuple = None,
+) -> sqla.CursorResult:
     """
-    Removes constraints from a specified table.
+    Executes the statement upserting a deduplicated batch of rows.
     """
-    try:
-        conn.execute(
-            text(f"ALTER TABLE {table_name} DROP CONSTRAINT temp_constraint;")
+    columns = tuple(rows[0].keys())
+    if len(rows) <= COPY_THRESHOLD:
+        return conn.execute(
+            _values_statement(table_name, columns, pk_cols, returning_cols),
+            {"rows": json.dumps(rows, default=str)},
         )
-    except sqla.exc.SQLAlchemyError as e:
-        raise ConnectionError(
-            f"Error removing constraints from table {table_name}: {e}"
-        ) from e
+    tmp_table_name = create_tmp_table(conn, table_name, rows)
+    return conn.execute(
+        _merge_statement(
+            table_name,
+            tmp_table_name,
+            columns,
+            pk_cols,
+            returning_cols,
+        )
+    )
 
 
 def upsert(
@@ -100,54 +428,121 @@ def upsert(
 ) -> int:
     """
     Performs an upsert operation which inserts or updates data based on conflict resolution.
+    The row is inserted directly, without staging it in a temporary table.
     """
-    tmp_table_name = create_tmp_table(conn, table_name, data_dict)
     try:
-        conflict_cols = [
-            f"{col}=EXCLUDED.{col}"
-            for col in data_dict.keys()
-            if col not in pk_cols
-        ]
-        add_constraints(conn, table_name, pk_cols)
-        query = (
-            f"INSERT INTO {table_name} ({', '.join(data_dict.keys())}) SELECT {', '.join(data_dict.keys())} FROM {tmp_table_name} "  # pylint: disable=line-too-long
-            f"ON CONFLICT ({', '.join(pk_cols)}) DO UPDATE SET {', '.join(conflict_cols)}"  # pylint: disable=line-too-long
-        )
-        query += f" RETURNING {returning_col};" if returning_col else ";"
-        result = (
-            conn.execute(text(query), data_dict).scalar()
-            if returning_col
-            else conn.execute(text(query), data_dict).rowcount
+        query = _upsert_statement(
+            table_name,
+            tuple(data_dict.keys()),
+            tuple(pk_cols),
+            (returning_col,) if returning_col else None,
         )
-        remove_constraints(conn, table_name)
-        drop_tmp_table(conn, tmp_table_name)
+        if not returning_col:
+            return conn.execute(query, data_dict).rowcount
+        result = conn.execute(query, data_dict).scalar()
+        if result is None:
+            # The row was committed unchanged by a concurrent transaction
+            # after the statement started, see bulk_upsert
+            result = conn.execute(query, data_dict).scalar()
     except sqla.exc.SQLAlchemyError as e:
         raise ConnectionError(
             f"Error upserting data into table {table_name}: {e}"
         ) from e
+    if result is None:
+        raise ConnectionError(
+            f"Error upserting data into table {table_name}: "
+            "the row was not returned"
+        )
     return result
 
 
-def load_order_data(
+def copy_query_to_csv(
+    conn: sqla.engine.base.Connection, query: str
+) -> io.BytesIO:
+    """
+    Runs a query with COPY ... TO STDOUT and returns its result as CSV with a
+    header row, read from the server as a single stream.
+    """
+    statement = f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"
+    buffer = io.BytesIO()
+    cursor = conn.connection.cursor()
+    try:
+        if conn.dialect.driver == "psycopg":
+            with cursor.copy(statement) as copy:
+                for data in copy:
+                    buffer.write(data)
+        else:
+            cursor.copy_expert(statement, buffer)
+    except conn.dialect.loaded_dbapi.Error as e:
+        raise ConnectionError(f"Error copying query results: {e}") from e
+    finally:
+        cursor.close()
+    buffer.seek(0)
+    return buffer
+
+
+def load_order_table(
     conn: sqla.engine.base.Connection, partner_name: str
-) -> pd.DataFrame:
-    """
-    Loads order data for a given partner from the database.
-    """
-    query = (
-        f"SELECT orders.order_id, orders.platform_order_id, orders.platform_order_number, orders.order_status, "  # pylint: disable=line-too-long
-        f"orders.order_placed_timestamp, orders.order_updated_timestamp, orders.order_prepare_for_timestamp, "  # pylint: disable=line-too-long
-        f"orders.order_start_prepping_at_timestamp, customers.customer_id, customers.first_name, "  # pylint: disable=line-too-long
-        f"customers.contact_number, customers.contact_access_code, partners.partner_id, partners.partner_name, "  # pylint: disable=line-too-long
-        f"items.item_id, items.platform_item_id, items.item_name, items.item_operational_name, items.item_fractional_cost, "  # pylint: disable=line-too-long
-        f"order_items.quantity AS item_quantity, order_items.fractional_price AS item_fractional_price, "  # pylint: disable=line-too-long
-        f"modifiers.modifier_id, modifiers.platform_modifier_id, modifiers.modifier_name, "  # pylint: disable=line-too-long
-        f"modifiers.modifier_operational_name, order_item_modifiers.quantity AS modifier_quantity, "  # pylint: disable=line-too-long
-        f"order_item_modifiers.fractional_price AS modifier_fractional_price "  # pylint: disable=line-too-long
-        f"FROM orders FULL JOIN customers ON orders.customer_id = customers.customer_id "  # pylint: disable=line-too-long
-        f"FULL JOIN partners ON orders.partner_id = partners.partner_id FULL JOIN order_items ON orders.order_id = order_items.order_id "  # pylint: disable=line-too-long
-        f"FULL JOIN items ON order_items.item_id = items.item_id FULL JOIN order_item_modifiers ON order_items.order_id = order_item_modifiers.order_id "  # pylint: disable=line-too-long
-        f"AND order_items.item_id = order_item_modifiers.item_id FULL JOIN modifiers ON order_item_modifiers.modifier_id = modifiers.modifier_id "  # pylint: disable=line-too-long
-        f"WHERE partners.partner_name = '{partner_name}';"
-    )
-    return pd.read_sql(query, conn)
+) -> pa.Table:
+    """
+    Loads order data for a given partner from the database as an Arrow table.
+    The rows are copied out as CSV and parsed into columns by pyarrow, without
+    building a Python object per value.
+    """
+    # COPY does not take bind parameters, so the partner is resolved to its
+    # integer IDs first and only those are written into the query
+    partner_ids = conn.execute(
+        text(
+            "SELECT partner_id FROM partners WHERE partner_name = :partner_name"
+        ),
+        {"partner_name": partner_name},
+    ).scalars()
+    select = (
+        f"{ORDER_DATA_SELECT} WHERE partners.partner_id IN "
+        f"({', '.join(str(int(pid)) for pid in partner_ids) or 'NULL'})"
+    )
+    return pa_csv.read_csv(
+        copy_query_to_csv(conn, select),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={
+                col: pa.string() for col in ORDER_DATA_STRING_COLUMNS
+            },
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+
+
+def load_order_data(
+    conn: sqla.engine.base.Connection,
+    partner_name: str,
+    chunksize: int = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Loads order data for a given partner from the database as a DataFrame,
+    through load_order_table. If chunksize is given, an iterator over
+    DataFrames of that many rows is returned instead, streamed from a
+    server-side cursor so the whole result is never held in memory at once.
+    """
+    if chunksize:
+        return pd.read_sql(
+            ORDER_DATA_QUERY.execution_options(stream_results=True),
+            conn,
+            params={"partner_name": partner_name},
+            chunksize=chunksize,
+        )
+    return load_order_table(conn, partner_name).to_pandas(
+        coerce_temporal_nanoseconds=True
+    )
+
+
+def export_order_data(
+    conn: sqla.engine.base.Connection, partner_name: str, path: str
+):
+    """
+    Writes the order data of a given partner to a Parquet file, so analyses can
+    read it column by column with pd.read_parquet instead of querying the
+    database.
+    """
+    pq.write_table(load_order_table(conn, partner_name), path)
@@ -1,18 +1,44 @@
 """
 This module manages the insertion and updating of customer, order, item, and
 modifier data in the database for the dynamic pricing platform.
-It uses SQL upserts to ensure data integrity.
+It uses SQL upserts to ensure data integrity. Run as a script, it bulk-loads
+a JSON file of fetched orders for a partner.
 """
 
-from datetime import datetime
+import argparse
+import itertools
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
 import sqlalchemy as sqla
 from sqlalchemy.sql import text
-from dynamic_pricing.core.db_utils import upsert
+from dynamic_pricing.core.db_utils import (
+    bulk_upsert,
+    get_engine,
+    upsert,
+)
+
+BACKFILL_BATCH_SIZE = 500  # Orders loaded and committed per transaction
 
+partner_ids: Dict[tuple, int] = {}  # Partner IDs by database URL and name
 
-def parse_datetime(date_str):
-    """Helper function to parse datetime strings."""
-    return datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%SZ")
+
+def timestamp_value(date_str: str) -> str:
+    """
+    Helper function to trim UTC timestamps such as 2023-07-10T19:17:59.285Z
+    to whole seconds. The ISO string is parsed by Postgres when it is written
+    to a TIMESTAMP column, so no datetime is built in Python.
+    """
+    return date_str[:19]
+
+
+def customer_fields(customer_data: dict) -> dict:
+    """
+    Build the 'customers' row for a customer.
+    """
+    fields = ["first_name", "contact_number", "contact_access_code"]
+    return {field: customer_data[field] for field in fields}
 
 
 def insert_customer(
@@ -22,131 +48,274 @@ def insert_customer(
     Insert or update customer data in the 'customers' table using upsert
     functionality.
     """
-    fields = ["first_name", "contact_number", "contact_access_code"]
     return upsert(
         conn,
         "customers",
-        {field: customer_data[field] for field in fields},
+        customer_fields(customer_data),
         ["contact_number"],
         "customer_id",
     )
 
 
-def insert_order(
-    conn: sqla.engine.base.Connection,
-    order_data: dict,
-    partner_id: int,
-    customer_id: int,
-) -> int:
+def order_fields(order_data: dict, partner_id: int, customer_id: int) -> dict:
     """
-    Insert or update order data in the 'orders' table using upsert functionality.
+    Build the 'orders' row for an order.
     """
-    order_fields = {
+    return {
         "platform_order_id": order_data["id"],
         "platform_order_number": order_data["order_number"],
         "order_status": order_data["status"],
-        "order_placed_timestamp": parse_datetime(
+        "order_placed_timestamp": timestamp_value(
             order_data["status_log"][0]["at"]
         ),
-        "order_updated_timestamp": parse_datetime(
-            order_data["status_log"][1]["at"].split(".")[0] + "Z"
+        "order_updated_timestamp": timestamp_value(
+            order_data["status_log"][1]["at"]
         ),
-        "order_prepare_for_timestamp": parse_datetime(
+        "order_prepare_for_timestamp": timestamp_value(
             order_data["prepare_for"]
         ),
-        "order_start_prepping_at_timestamp": parse_datetime(
+        "order_start_prepping_at_timestamp": timestamp_value(
             order_data["start_preparing_at"]
         ),
         "customer_id": customer_id if customer_id != -1 else None,
         "partner_id": partner_id,
     }
+
+
+def insert_order(
+    conn: sqla.engine.base.Connection,
+    order_data: dict,
+    partner_id: int,
+    customer_id: int,
+) -> int:
+    """
+    Insert or update order data in the 'orders' table using upsert functionality.
+    """
     return upsert(
-        conn, "orders", order_fields, ["platform_order_id"], "order_id"
+        conn,
+        "orders",
+        order_fields(order_data, partner_id, customer_id),
+        ["platform_order_id"],
+        "order_id",
     )
 
 
-def insert_item(conn: sqla.engine.base.Connection, item_data: dict) -> int:
+def item_fields(item_data: dict) -> dict:
     """
-    Insert or update item data in the 'items' table using upsert functionality.
+    Build the 'items' row for an item.
     """
-    item_fields = {
+    return {
         "platform_item_id": item_data["pos_item_id"],
         "item_name": item_data["name"],
         "item_operational_name": item_data["operational_name"],
     }
-    return upsert(conn, "items", item_fields, ["item_name"], "item_id")
 
 
-def insert_modifier(
-    conn: sqla.engine.base.Connection, modifier_data: dict
-) -> int:
+def insert_items(
+    conn: sqla.engine.base.Connection, items_data: List[dict]
+) -> Dict[str, int]:
     """
-    Insert or update modifier data in the 'modifiers' table using upsert
-    functionality.
+    Insert or update a batch of items in the 'items' table using a single bulk
+    upsert, returning the item IDs keyed by item name.
     """
-    modifier_fields = {
+    return dict(
+        bulk_upsert(
+            conn,
+            "items",
+            [item_fields(item_data) for item_data in items_data],
+            ["item_name"],
+            ["item_name", "item_id"],
+        )
+    )
+
+
+def modifier_fields(modifier_data: dict) -> dict:
+    """
+    Build the 'modifiers' row for a modifier.
+    """
+    return {
         "platform_modifier_id": modifier_data["pos_item_id"],
         "modifier_name": modifier_data["name"],
         "modifier_operational_name": modifier_data["operational_name"],
     }
-    return upsert(
-        conn, "modifiers", modifier_fields, ["modifier_name"], "modifier_id"
+
+
+def insert_modifiers(
+    conn: sqla.engine.base.Connection, modifiers_data: List[dict]
+) -> Dict[str, int]:
+    """
+    Insert or update a batch of modifiers in the 'modifiers' table using a
+    single bulk upsert, returning the modifier IDs keyed by modifier name.
+    """
+    return dict(
+        bulk_upsert(
+            conn,
+            "modifiers",
+            [
+                modifier_fields(modifier_data)
+                for modifier_data in modifiers_data
+            ],
+            ["modifier_name"],
+            ["modifier_name", "modifier_id"],
+        )
     )
 
 
-def insert_order_item(conn, order_id: int, item_id: int, item_data: dict):
+def order_item_fields(order_id: int, item_id: int, item_data: dict) -> dict:
     """
-    Insert or update order item data in the 'order_items' table using upsert
-    functionality.
+    Build the 'order_items' row for an item of an order.
     """
-    order_item_fields = {
+    return {
         "order_id": order_id,
         "item_id": item_id,
         "quantity": item_data["quantity"],
         "fractional_price": item_data["total_price"]["fractional"],
     }
-    upsert(conn, "order_items", order_item_fields, ["order_id", "item_id"])
 
 
-def insert_order_item_modifier(
-    conn, order_id: int, item_id: int, modifier_id: int, modifier_data: dict
-):
+def order_item_modifier_fields(
+    order_id: int, item_id: int, modifier_id: int, modifier_data: dict
+) -> dict:
     """
-    Insert or update order item modifier data in the 'order_item_modifiers'
-    table using upsert functionality.
+    Build the 'order_item_modifiers' row for a modifier of an order item.
     """
-    order_item_modifier_fields = {
+    return {
         "order_id": order_id,
         "item_id": item_id,
         "modifier_id": modifier_id,
         "quantity": modifier_data["quantity"],
         "fractional_price": modifier_data["total_price"]["fractional"],
     }
-    upsert(
+
+
+def insert_order_items(conn, order_items: List[dict]):
+    """
+    Insert or update a batch of order items in the 'order_items' table using
+    a single bulk upsert.
+    """
+    bulk_upsert(conn, "order_items", order_items, ["order_id", "item_id"])
+
+
+def insert_order_item_modifiers(conn, order_item_modifiers: List[dict]):
+    """
+    Insert or update a batch of order item modifiers in the
+    'order_item_modifiers' table using a single bulk upsert.
+    """
+    bulk_upsert(
         conn,
         "order_item_modifiers",
-        order_item_modifier_fields,
+        order_item_modifiers,
         ["order_id", "item_id", "modifier_id"],
     )
 
 
-def get_partner_id(conn, partner_name: str) -> int:
+def flatten_order_contents(
+    orders_data: List[dict],
+) -> Tuple[List[dict], List[dict]]:
     """
-    Retrieve the partner ID from the 'partners' table.
+    Walk a batch of orders once, before any database call, and collect their
+    distinct items and modifiers, keyed by name as in the database.
+    """
+    items_data, modifiers_data = {}, {}
+    for order_data in orders_data:
+        for item_data in order_data["items"]:
+            items_data[item_data["name"]] = item_data
+            for modifier_data in item_data["modifiers"]:
+                modifiers_data[modifier_data["name"]] = modifier_data
+    return list(items_data.values()), list(modifiers_data.values())
+
+
+def insert_menu(
+    conn, orders_data: List[dict]
+) -> Tuple[Dict[str, int], Dict[str, int]]:
     """
-    query = text(
-        "SELECT partner_id FROM partners WHERE partner_name = :partner_name"
+    Insert or update the distinct items and modifiers of a batch of orders,
+    returning the item IDs and the modifier IDs keyed by name.
+    """
+    items_data, modifiers_data = flatten_order_contents(orders_data)
+    return insert_items(conn, items_data), insert_modifiers(
+        conn, modifiers_data
     )
-    result = conn.execute(query, {"partner_name": partner_name}).scalar()
-    return result or -1
+
+
+def insert_order_contents(
+    conn,
+    order_ids: Dict[str, int],
+    orders_data: List[dict],
+    menu_ids: Tuple[Dict[str, int], Dict[str, int]] = None,
+):
+    """
+    Link the items and modifiers of a batch of orders to the orders through
+    the 'order_items' and 'order_item_modifiers' tables. The order IDs are
+    keyed by platform order ID. The items and modifiers are inserted or
+    updated first with insert_menu, unless their IDs are given in menu_ids.
+    """
+    item_ids, modifier_ids = menu_ids or insert_menu(conn, orders_data)
+
+    order_items, order_item_modifiers = [], []
+    for order_data in orders_data:
+        order_id = order_ids[order_data["id"]]
+        for item_data in order_data["items"]:
+            item_id = item_ids[item_data["name"]]
+            order_items.append(order_item_fields(order_id, item_id, item_data))
+            for modifier_data in item_data["modifiers"]:
+                order_item_modifiers.append(
+                    order_item_modifier_fields(
+                        order_id,
+                        item_id,
+                        modifier_ids[modifier_data["name"]],
+                        modifier_data,
+                    )
+                )
+    insert_order_items(conn, order_items)
+    insert_order_item_modifiers(conn, order_item_modifiers)
+
+
+def get_partner_id(conn, partner_name: str) -> int:
+    """
+    Retrieve the partner ID from the 'partners' table. IDs that are found are
+    cached per database, since partners are never renumbered.
+    """
+    key = (conn.engine.url, partner_name)
+    if key not in partner_ids:
+        query = text(
+            "SELECT partner_id FROM partners WHERE partner_name = :partner_name"
+        )
+        result = conn.execute(query, {"partner_name": partner_name}).scalar()
+        if result is None:
+            return -1
+        partner_ids[key] = result
+    return partner_ids[key]
+
+
+def validate_order_data(order_data: dict):
+    """
+    Builds every row that insert_order_data writes for a webhook order without
+    touching the database, so a malformed order is turned away before anything
+    is written. Raises ValueError if a field is missing or has the wrong shape.
+    """
+    try:
+        customer_fields(order_data["customer"])
+        order_fields(order_data, order_data["location_id"], -1)
+        for item_data in order_data["items"]:
+            item_fields(item_data)
+            order_item_fields(-1, -1, item_data)
+            for modifier_data in item_data["modifiers"]:
+                modifier_fields(modifier_data)
+                order_item_modifier_fields(-1, -1, -1, modifier_data)
+    except (KeyError, TypeError, IndexError) as e:
+        raise ValueError(f"Invalid order data: {e!r}") from e
 
 
 def insert_order_data(
-    conn, partner_name: str, order_data: dict, is_webhook=True
+    conn, partner_name: Optional[str], order_data: dict, is_webhook=True
 ):
     """
     Handles the logic to insert all order related data including customer,
-    order items, and modifiers.
+    order items, and modifiers. Nothing is committed here, so the whole order
+    is written in the caller's transaction. Webhook orders are linked to their
+    partner through their location_id, so partner_name is only read for
+    fetched orders.
     """
     if is_webhook:
         customer_id = insert_customer(conn, order_data["customer"])
@@ -161,11 +330,99 @@ def insert_order_data(
             )
         order_id = insert_order(conn, order_data, partner_id, -1)
 
-    for item_data in order_data["items"]:
-        item_id = insert_item(conn, item_data)
-        insert_order_item(conn, order_id, item_id, item_data)
-        for modifier_data in item_data["modifiers"]:
-            modifier_id = insert_modifier(conn, modifier_data)
-            insert_order_item_modifier(
-                conn, order_id, item_id, modifier_id, modifier_data
-            )
+    insert_order_contents(conn, {order_data["id"]: order_id}, [order_data])
+
+
+def insert_orders_data(
+    conn,
+    partner_name: str,
+    orders_data: List[dict],
+    menu_ids: Tuple[Dict[str, int], Dict[str, int]] = None,
+):
+    """
+    Bulk-loads a batch of fetched orders for a partner. Each table is upserted
+    once for the whole batch and the generated IDs are mapped back through
+    their natural keys. The IDs of items and modifiers already inserted with
+    insert_menu can be given in menu_ids.
+    """
+    partner_id = get_partner_id(conn, partner_name)
+    if partner_id == -1:
+        raise ValueError(
+            f"Partner {partner_name} does not exist in the database."
+        )
+
+    orders_rows = [
+        order_fields(order_data, partner_id, -1) for order_data in orders_data
+    ]
+    order_ids = dict(
+        bulk_upsert(
+            conn,
+            "orders",
+            orders_rows,
+            ["platform_order_id"],
+            ["platform_order_id", "order_id"],
+        )
+    )
+    insert_order_contents(conn, order_ids, orders_data, menu_ids)
+
+
+def read_orders(file) -> Iterator[dict]:
+    """
+    Yields the orders of a fetched orders file. JSON Lines files, with one
+    order per line, are streamed rather than loaded whole.
+    """
+    if file.name.endswith(".jsonl"):
+        return (json.loads(line) for line in file if line.strip())
+    return iter(json.load(file))
+
+
+def backfill_orders(partner_name: str, orders: Iterator[dict], workers: int):
+    """
+    Loads orders in batches of BACKFILL_BATCH_SIZE, each in its own transaction
+    on its own pooled connection, with up to workers batches loading at once.
+    The items and modifiers of a batch are committed before its orders.
+    """
+
+    def load_batch(batch: List[dict]):
+        # Every batch upserts the same items and modifiers, and ON CONFLICT
+        # locks those rows until the transaction ends. They are committed in
+        # a short transaction of their own, so concurrent batches do not wait
+        # for each other's orders.
+        with get_engine().begin() as connection:
+            menu_ids = insert_menu(connection, batch)
+        with get_engine().begin() as connection:
+            insert_orders_data(connection, partner_name, batch, menu_ids)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        while batch := list(itertools.islice(orders, BACKFILL_BATCH_SIZE)):
+            # Only read ahead as many batches as there are workers
+            if len(pending) >= workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(load_batch, batch))
+        for future in pending:
+            future.result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backfill a partner's fetched orders into the database."
+    )
+    parser.add_argument("partner_name")
+    parser.add_argument(
+        "orders_file",
+        help="JSON file with a list of orders, or JSON Lines file with one "
+        "order per line",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="number of batches loaded concurrently",
+    )
+    args = parser.parse_args()
+
+    with open(args.orders_file, "r", encoding="utf-8") as file:
+        backfill_orders(args.partner_name, read_orders(file), args.workers)
@@ -3,13 +3,21 @@ This module defines webhook endpoints for handling order updates and status sync
 with a third-party API.
 """
 
-import datetime
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from flask import Flask, jsonify, request
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-from dynamic_pricing.core.order_manager import insert_order_data
-from dynamic_pricing.core.db_utils import get_db_connection
+from urllib3.util.retry import Retry
+from dynamic_pricing.core.order_manager import (
+    insert_order_data,
+    validate_order_data,
+)
+from dynamic_pricing.core.db_utils import get_engine
 from dynamic_pricing.webhook.config import (
     BASE_URL_DEV,
     BASE_URL_PROD,
@@ -19,63 +27,135 @@ from dynamic_pricing.webhook.config import (
 
 app = Flask(__name__)
 
+TOKEN_EXPIRY_MARGIN = 60  # Seconds before expiry that a token is refreshed
+REQUEST_TIMEOUT = 10  # Seconds to wait on the delivery service
+
+bearer_tokens = {}  # (token, monotonic expiry time) by prod flag
+bearer_token_lock = threading.Lock()
+
+sync_executor = ThreadPoolExecutor(max_workers=8)
+
+# Delivery service URLs by prod flag; order URLs are formatted with the ID
+AUTH_URLS = {False: AUTH_URL_DEV, True: AUTH_URL_PROD}
+API_URL_TEMPLATES = {False: BASE_URL_DEV + "/%s", True: BASE_URL_PROD + "/%s"}
+SYNC_STATUS_URL_TEMPLATES = {
+    prod: template + "/sync_status"
+    for prod, template in API_URL_TEMPLATES.items()
+}
+
+# Bodies of the constant responses, serialized once instead of per request
+MESSAGE_BODIES = {
+    message: json.dumps({"message": message}, separators=(",", ":")) + "\n"
+    for message in (
+        "The API is working just load a valid URL",
+        "Invalid webhook payload",
+        "Order rejected successfully",
+        "Order canceled successfully",
+        "Order received successfully",
+    )
+}
+
+# Calls to the delivery service reuse kept-alive connections instead of
+# opening a new TLS connection for every request. Headers shared by every
+# call are set once here, and json= bodies set their own content type.
+session = requests.Session()
+session.headers["accept"] = "application/json"
+session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=20,
+        max_retries=Retry(
+            total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504]
+        ),
+    ),
+)
+
+
+def utc_timestamp():
+    """Format the current UTC time as an ISO 8601 string with milliseconds,
+    such as 2023-07-10T19:17:59.285Z."""
+    now = time.time()
+    seconds = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now))
+    return f"{seconds}.{int(now % 1 * 1000):03d}Z"
+
+
+def message_response(message):
+    """Build a JSON response with one of the constant messages."""
+    return app.response_class(
+        MESSAGE_BODIES[message], mimetype="application/json"
+    )
+
 
 def get_api_url(order_id, prod):
     """Get the API URL for the delivery service based on the environment."""
-    base_url = BASE_URL_PROD if prod else BASE_URL_DEV
-    return f"{base_url}/{order_id}"
+    return API_URL_TEMPLATES[prod] % order_id
 
 
 def get_auth_url(prod):
     """Gets the authentication URL for the delivery service
     based on the environment."""
-    return AUTH_URL_PROD if prod else AUTH_URL_DEV
+    return AUTH_URLS[prod]
 
 
 def get_bearer_token(prod=False):
-    """Retrieve the bearer token for authentication from the delivery service API."""
+    """Retrieve the bearer token for authentication from the delivery service API.
+    Tokens are cached until shortly before they expire."""
+    token, expires_at = bearer_tokens.get(prod, (None, 0.0))
+    if time.monotonic() < expires_at:
+        return token
+    with bearer_token_lock:
+        # Another thread may have refreshed the token while we waited
+        token, expires_at = bearer_tokens.get(prod, (None, 0.0))
+        if time.monotonic() < expires_at:
+            return token
+        token, expires_in = fetch_bearer_token(prod)
+        bearer_tokens[prod] = (
+            token,
+            time.monotonic() + expires_in - TOKEN_EXPIRY_MARGIN,
+        )
+        return token
+
+
+def fetch_bearer_token(prod=False):
+    """Request a new bearer token from the delivery service API, returning it
+    with its lifetime in seconds."""
     url = get_auth_url(prod)
     payload = {"grant_type": "client_credentials"}
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/x-www-form-urlencoded",
-    }
     client_id = os.getenv("PROD_CLIENT_ID" if prod else "DEV_CLIENT_ID")
     secret = os.getenv("PROD_SECRET" if prod else "DEV_SECRET")
 
-    response = requests.post(
+    # The form payload is sent as application/x-www-form-urlencoded
+    response = session.post(
         url,
         auth=HTTPBasicAuth(client_id, secret),
         data=payload,
-        headers=headers,
+        timeout=REQUEST_TIMEOUT,
     )
     response.raise_for_status()
-    return response.json()["access_token"]
+    token = response.json()
+    return token["access_token"], token.get("expires_in", 0)
 
 
 def sync_status(order_id, payload, prod=False):
-    """Synchronize the status of an order with the delivery service API."""
-    url = get_api_url(order_id, prod) + "/sync_status"
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "Authorization": f"Bearer {get_bearer_token(prod)}",
-    }
-    response = requests.post(url, json=payload, headers=headers)
+    """Synchronize the status of an order with the delivery service API.
+    Only the status code is checked, the response body is not parsed."""
+    url = SYNC_STATUS_URL_TEMPLATES[prod] % order_id
+    headers = {"Authorization": "Bearer " + get_bearer_token(prod)}
+    response = session.post(
+        url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT
+    )
     response.raise_for_status()
-    return response.json()
 
 
 def update_order_status(order_id, status, prod=False):
     """Update the status of an order in the delivery service database."""
     url = get_api_url(order_id, prod)
     payload = {"status": status}
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "Authorization": f"Bearer {get_bearer_token(prod)}",
-    }
-    response = requests.patch(url, json=payload, headers=headers)
+    headers = {"Authorization": "Bearer " + get_bearer_token(prod)}
+    response = session.patch(
+        url, json=payload, headers=headers, timeout=REQUEST_TIMEOUT
+    )
     response.raise_for_status()
     return response.json()
 
@@ -95,10 +175,7 @@ def prod_webhook():
 @app.route("/", methods=["GET"])
 def test():
     """API test endpoint."""
-    return (
-        jsonify({"message": "The API is working just load a valid URL"}),
-        200,
-    )
+    return message_response("The API is working just load a valid URL"), 200
 
 
 def handle_webhook(prod):
@@ -109,43 +186,63 @@ def handle_webhook(prod):
             data
         )  # Using logging instead of print for better practice
 
-    occurred_at = (
-        datetime.datetime.now().isoformat(timespec="milliseconds") + "Z"
-    )
+    # Malformed payloads are turned away before any outbound call is made.
+    # Orders that are written are checked in full before their status sync
+    # is submitted, so a payload that cannot be stored is not synced either.
+    try:
+        event = data["event"]
+        order = data["body"]["order"]
+        status = order["status"]
+        order_id = order["id"]
+        missing_pos_item_id = status != "rejected" and any(
+            not item.get("pos_item_id") for item in order["items"]
+        )
+        if status not in ("rejected", "canceled") and not missing_pos_item_id:
+            validate_order_data(order)
+    except (KeyError, TypeError, AttributeError, ValueError):
+        return message_response("Invalid webhook payload"), 400
+
+    if status == "rejected":
+        return message_response("Order rejected successfully"), 200
+
+    occurred_at = utc_timestamp()
     payload = {"status": "succeeded", "occurred_at": occurred_at}
 
-    if data["body"]["order"]["status"] == "rejected":
-        return jsonify({"message": "Order rejected successfully"}), 200
-
-    for item in data["body"]["order"]["items"]:
-        if not item["pos_item_id"]:
-            return (
-                jsonify(
-                    {
-                        "status": "failed",
-                        "reason": "pos_item_id_not_found",
-                        "notes": "id not found",
-                        "occurred_at": occurred_at,
-                    }
-                ),
-                400,
-            )
-
-    if data["event"] == "order.status_update":
-        sync_status(data["body"]["order"]["id"], payload, prod)
-
-    if data["body"]["order"]["status"] == "canceled":
-        return jsonify({"message": "Order canceled successfully"}), 200
-
-    connection = get_db_connection()
-    insert_order_data(
-        connection,
-        data["body"]["order"]["restaurant"]["name"],
-        data["body"]["order"],
-        is_webhook=True,
+    if missing_pos_item_id:
+        return (
+            jsonify(
+                {
+                    "status": "failed",
+                    "reason": "pos_item_id_not_found",
+                    "notes": "id not found",
+                    "occurred_at": occurred_at,
+                }
+            ),
+            400,
+        )
+
+    # The status sync runs in the background while the order is written, and
+    # is waited for before responding
+    sync = (
+        sync_executor.submit(sync_status, order_id, payload, prod)
+        if event == "order.status_update"
+        else None
     )
-    return jsonify({"message": "Order received successfully"}), 200
+
+    if status == "canceled":
+        if sync:
+            sync.result()
+        return message_response("Order canceled successfully"), 200
+
+    # All of the order's upserts share one transaction and a single commit, on
+    # a connection that goes back to the shared pool afterwards
+    with get_engine().begin() as connection:
+        insert_order_data(connection, None, order, is_webhook=True)
+    if sync:
+        sync.result()
+    return message_response("Order received successfully"), 200
 
 
 if __name__ == "__main__":
+    # Development server only, the webhook is deployed with gunicorn
     app.run(debug=False)
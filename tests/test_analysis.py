@@ -63,13 +63,20 @@ data = {
 }
 
 
-@pytest.fixture
-def sample_df():
-    """Fixture to provide a DataFrame setup for testing."""
+@pytest.fixture(scope="module")
+def base_df():
+    """Fixture to build the test DataFrame once for the module."""
     return pd.DataFrame(data)
 
 
 @pytest.fixture
+def sample_df(base_df):  # pylint: disable=W0621
+    """Fixture to provide a DataFrame setup for testing. The metrics add
+    columns to the frame they are given, so each test gets its own copy."""
+    return base_df.copy()
+
+
+@pytest.fixture(scope="module")
 def sample_time_intervals():
     """Fixture to provide a list of time intervals for testing revenue
     calculations."""
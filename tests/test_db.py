@@ -6,15 +6,80 @@ retrieval of loaded data to ensure proper functionality and integration.
 
 import json
 import os
+import subprocess
+import sys
+from unittest import mock
 
 import pandas as pd
-from dotenv import load_dotenv
+import pytest
 from sqlalchemy.engine.base import Connection
 from sqlalchemy.sql import text
-from dynamic_pricing.core.order_manager import insert_order_data
-from dynamic_pricing.core.db_utils import load_order_data
+from dynamic_pricing.core.order_manager import (
+    BACKFILL_BATCH_SIZE,
+    backfill_orders,
+    insert_order_data,
+    insert_orders_data,
+    read_orders,
+)
+from dynamic_pricing.core import db_utils
+from dynamic_pricing.core.db_utils import (
+    COPY_THRESHOLD,
+    ECHO_SAMPLE_RATE,
+    bulk_upsert,
+    export_order_data,
+    load_order_data,
+    load_order_table,
+    upsert,
+)
 
-load_dotenv()
+EXPECTED_ORDER_IDS = frozenset({"gb:6606c495-e33a-4bde-b152-e3ddd4efe0ee"})
+EXPECTED_ITEM_NAMES = frozenset(
+    {
+        "Cheese Filled Bifteki Wrap (Handmade Greek Pitta Wraps)",
+        "Cheese Filled Bifteki (Handmade Single Grills)",
+    }
+)
+EXPECTED_MODIFIER_NAMES = frozenset({"Mustard", "Mayonnaise", None})
+
+
+@pytest.fixture
+def inserted_order(connection: Connection, partner1: str, order_data: dict):
+    """Fixture that inserts the test order in the test's transaction."""
+    insert_order_data(
+        connection,
+        partner1,
+        order_data=order_data,
+        is_webhook=False,
+    )
+
+
+ECHO_SCRIPT = """
+from sqlalchemy import text
+from dynamic_pricing.core.db_utils import get_engine
+
+with get_engine().connect() as conn:
+    for _ in range(%d):
+        conn.execute(text("SELECT 1"))
+"""
+
+
+def test_echo_sample(db_connection: Connection):  # pylint: disable=W0613
+    """Test that DB_ECHO logs a sample of whole statements, each with its SQL
+    text rather than a bare parameter record."""
+    result = subprocess.run(
+        [sys.executable, "-c", ECHO_SCRIPT % (2 * ECHO_SAMPLE_RATE + 50)],
+        env={**os.environ, "DB_ECHO": "true"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    lines = result.stderr.splitlines()
+    assert (
+        len(lines) == 3
+    ), "The number of sampled statements does not match the expected count."
+    assert all(
+        line.startswith("SELECT 1") for line in lines
+    ), "A sampled record does not hold the statement's SQL text."
 
 
 def test_tables(connection: Connection):
@@ -32,16 +97,14 @@ def test_tables(connection: Connection):
     assert ans == 7, "The number of tables does not match the expected count."
 
 
-def test_insert_order_data(connection: Connection):
+def test_insert_order_data(
+    connection: Connection, partner1: str, order_data: dict
+):
     """Test the insertion of order data into the database from a JSON file to
     ensure data integrity and functionality."""
-    with open(
-        "tests/test_data/test_order.json", "r", encoding="utf-8"
-    ) as file:
-        order_data = json.load(file)
     insert_order_data(
         connection,
-        os.getenv("PARTNER1"),
+        partner1,
         order_data=order_data,
         is_webhook=False,
     )
@@ -57,23 +120,271 @@ def test_insert_order_data(connection: Connection):
     ), "The number of inserted orders does not match the expected count."
 
 
-def test_load_data(connection: Connection):
+@pytest.fixture(scope="module")
+def loaded_df(
+    db_connection: Connection, partner1: str, order_data: dict
+) -> pd.DataFrame:
+    """Fixture that loads the test order once for the assertions on the
+    loaded DataFrame, in a transaction that is rolled back straight away."""
+    with db_connection.begin() as transaction:
+        insert_order_data(
+            db_connection,
+            partner1,
+            order_data=order_data,
+            is_webhook=False,
+        )
+        df = load_order_data(db_connection, partner1)
+        transaction.rollback()
+    return df
+
+
+def test_load_data(loaded_df: pd.DataFrame):
     """Test the loading of order data from the database, verifying the data
-    structure and content against expected values."""
-    df: pd.DataFrame = load_order_data(connection, os.getenv("PARTNER1"))
-    assert df.shape == (
+    structure against expected dimensions."""
+    assert loaded_df.shape == (
         3,
         27,
     ), "DataFrame shape does not match expected dimensions."
-    assert set(df["platform_order_id"]) == {
-        "gb:6606c495-e33a-4bde-b152-e3ddd4efe0ee"
-    }, "Platform order ID does not match expected."
-    assert set(df["item_operational_name"]) == {
-        "Cheese Filled Bifteki Wrap (Handmade Greek Pitta Wraps)",
-        "Cheese Filled Bifteki (Handmade Single Grills)",
-    }, "Item operational names do not match expected."
-    assert set(df["modifier_operational_name"]) == {
-        "Mustard",
-        "Mayonnaise",
-        None,
-    }, "Modifier operational names do not match expected."
+
+
+@pytest.mark.parametrize(
+    "column, expected",
+    [
+        ("platform_order_id", EXPECTED_ORDER_IDS),
+        ("item_operational_name", EXPECTED_ITEM_NAMES),
+        ("modifier_operational_name", EXPECTED_MODIFIER_NAMES),
+    ],
+)
+def test_load_data_values(
+    loaded_df: pd.DataFrame, column: str, expected: frozenset
+):
+    """Test the content of the loaded order data against expected values."""
+    assert (
+        set(loaded_df[column]) == expected
+    ), f"Values of {column} do not match expected."
+
+
+def test_load_order_table(
+    connection: Connection, partner1: str, inserted_order
+):  # pylint: disable=W0613
+    """Test loading order data as an Arrow table, which should hold the same
+    rows and values as the DataFrame without converting to pandas."""
+    table = load_order_table(connection, partner1)
+    assert (
+        table.num_rows,
+        table.num_columns,
+    ) == (3, 27), "Table shape does not match expected dimensions."
+    assert (
+        set(table["platform_order_id"].unique().to_pylist())
+        == EXPECTED_ORDER_IDS
+    ), "Platform order ID does not match expected."
+    assert (
+        set(table["modifier_operational_name"].unique().to_pylist())
+        == EXPECTED_MODIFIER_NAMES
+    ), "Modifier operational names do not match expected."
+
+
+def test_export_order_data(
+    connection: Connection, partner1: str, tmp_path, inserted_order
+):  # pylint: disable=W0613
+    """Test that order data written to Parquet reads back with the same shape
+    and columns as the loaded DataFrame."""
+    path = tmp_path / "orders.parquet"
+    export_order_data(connection, partner1, path)
+    df = pd.read_parquet(path)
+    assert df.shape == (3, 27), "Parquet shape does not match expected."
+    assert list(df.columns) == list(
+        load_order_data(connection, partner1).columns
+    ), "Parquet columns do not match the loaded DataFrame."
+
+
+def test_load_order_table_percent_name(
+    connection: Connection, order_data: dict
+):
+    """Test loading the orders of a partner whose name contains a percent
+    sign, which must reach the COPY query unescaped."""
+    connection.execute(
+        text("INSERT INTO partners (partner_name) VALUES ('50% Pizza')")
+    )
+    insert_orders_data(connection, "50% Pizza", [order_data])
+    assert (
+        load_order_table(connection, "50% Pizza").num_rows == 3
+    ), "The orders of the partner were not loaded."
+
+
+def test_load_data_chunks(
+    connection: Connection, partner1: str, inserted_order
+):  # pylint: disable=W0613
+    """Test that loading order data in chunks yields the same rows as loading
+    it whole."""
+    chunks = load_order_data(connection, partner1, chunksize=2)
+    assert [chunk.shape for chunk in chunks] == [
+        (2, 27),
+        (1, 27),
+    ], "DataFrame chunks do not match expected dimensions."
+
+
+def test_insert_orders_data(
+    connection: Connection, partner1: str, order_data: dict
+):
+    """Test the bulk loading of a batch of orders, which should add both
+    orders without duplicating their shared items or modifiers."""
+    new_order_data = {**order_data, "id": "gb:new-order"}
+    insert_orders_data(connection, partner1, [order_data, new_order_data])
+    ans = connection.execute(
+        text(
+            """SELECT (SELECT COUNT(*) FROM orders),
+                (SELECT COUNT(*) FROM items),
+                (SELECT COUNT(*) FROM modifiers),
+                (SELECT COUNT(*) FROM order_item_modifiers);
+            """
+        )
+    ).fetchone()
+    assert tuple(ans) == (
+        2,
+        2,
+        2,
+        4,
+    ), "The bulk loaded rows do not match the expected counts."
+
+
+def test_upsert_unchanged_row(connection: Connection):
+    """Test that upserting an unchanged row leaves the stored row untouched
+    while still returning its ID."""
+    customer = {
+        "first_name": "Test",
+        "contact_number": "+440000000000",
+        "contact_access_code": "000000",
+    }
+    customer_id = upsert(
+        connection, "customers", customer, ["contact_number"], "customer_id"
+    )
+    query = text("SELECT ctid FROM customers WHERE customer_id = :id")
+    ctid = connection.execute(query, {"id": customer_id}).scalar()
+    assert (
+        upsert(
+            connection,
+            "customers",
+            customer,
+            ["contact_number"],
+            "customer_id",
+        )
+        == customer_id
+    ), "The ID of the unchanged row was not returned."
+    assert (
+        connection.execute(query, {"id": customer_id}).scalar() == ctid
+    ), "The unchanged row was rewritten."
+
+
+def test_bulk_upsert_copy(connection: Connection):
+    """Test that a batch too large to bind as one parameter, which is copied
+    through a temporary table instead, returns the IDs of new and unchanged
+    rows."""
+    customers = [
+        {
+            "first_name": "Test",
+            "contact_number": f"+44{number:010d}",
+            "contact_access_code": "000000",
+        }
+        for number in range(COPY_THRESHOLD + 1)
+    ]
+    returning_cols = ["contact_number", "customer_id"]
+    customer_ids = dict(
+        bulk_upsert(
+            connection,
+            "customers",
+            customers,
+            ["contact_number"],
+            returning_cols,
+        )
+    )
+    assert len(customer_ids) == len(
+        customers
+    ), "Not every copied row returned its ID."
+    assert (
+        dict(
+            bulk_upsert(
+                connection,
+                "customers",
+                customers,
+                ["contact_number"],
+                returning_cols,
+            )
+        )
+        == customer_ids
+    ), "The IDs of the unchanged copied rows were not returned."
+
+
+@pytest.fixture
+def backfill_file(tmp_path, order_data: dict):
+    """Fixture that writes more than two batches of distinct orders to a JSON
+    Lines file."""
+    path = tmp_path / "orders.jsonl"
+    with open(path, "w", encoding="utf-8") as file:
+        for number in range(2 * BACKFILL_BATCH_SIZE + 1):
+            file.write(
+                json.dumps({**order_data, "id": f"gb:backfill-{number}"})
+            )
+            file.write("\n")
+    return path
+
+
+@pytest.fixture
+def committed(db_connection: Connection):
+    """Fixture that empties the order tables after a test that commits its
+    rows, since they are not rolled back."""
+    yield db_connection
+    with db_connection.begin():
+        db_connection.execute(
+            text(
+                """TRUNCATE orders, order_items, order_item_modifiers,
+                items, modifiers;"""
+            )
+        )
+
+
+def test_backfill_orders(committed: Connection, partner1: str, backfill_file):
+    """Test backfilling a JSON Lines file in concurrent batches, which share
+    their items and modifiers without duplicating them."""
+    with open(backfill_file, "r", encoding="utf-8") as file:
+        backfill_orders(partner1, read_orders(file), workers=2)
+    with committed.begin():
+        ans = committed.execute(
+            text(
+                """SELECT (SELECT COUNT(*) FROM orders),
+                    (SELECT COUNT(*) FROM items),
+                    (SELECT COUNT(*) FROM modifiers),
+                    (SELECT COUNT(*) FROM order_items),
+                    (SELECT COUNT(*) FROM order_item_modifiers);
+                """
+            )
+        ).fetchone()
+    orders = 2 * BACKFILL_BATCH_SIZE + 1
+    assert tuple(ans) == (
+        orders,
+        2,
+        2,
+        2 * orders,
+        2 * orders,
+    ), "The backfilled rows do not match the expected counts."
+
+
+def test_bulk_upsert_missing_rows(connection: Connection):
+    """Test that a bulk upsert whose rows are still not returned after the
+    rerun raises a clear error instead of returning a partial result."""
+    customer = {
+        "first_name": "Test",
+        "contact_number": "+440000000000",
+        "contact_access_code": "000000",
+    }
+    with mock.patch.object(db_utils, "_execute_bulk_upsert") as execute:
+        execute.return_value.fetchall.return_value = []
+        with pytest.raises(ConnectionError, match="not returned"):
+            bulk_upsert(
+                connection,
+                "customers",
+                [customer],
+                ["contact_number"],
+                ["contact_number", "customer_id"],
+            )
+    assert execute.call_count == 2, "The short upsert was not run again."
@@ -0,0 +1,132 @@
+"""
+Module to test the webhook app of the dynamic pricing application. It checks
+the caching of the delivery service's bearer tokens and the rejection of
+malformed payloads, without calling the service or the database.
+"""
+
+import json
+from unittest import mock
+
+import pytest
+
+from dynamic_pricing.webhook import app as webhook
+
+TOKEN_LIFETIME = 3600
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fixture that replaces the monotonic clock of the token cache with one
+    the test moves forward, starting from an empty cache."""
+    now = [1000.0]
+    monkeypatch.setattr(webhook.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(webhook, "bearer_tokens", {})
+    return now
+
+
+def token_post(**token):
+    """Mock of session.post answering every call with the given token."""
+    response = mock.Mock()
+    response.json.return_value = token
+    return mock.patch.object(webhook.session, "post", return_value=response)
+
+
+def test_bearer_token_cached(clock):  # pylint: disable=W0621
+    """Test that a token is fetched once and reused within its lifetime."""
+    with token_post(access_token="a", expires_in=TOKEN_LIFETIME) as post:
+        assert webhook.get_bearer_token() == "a"
+        clock[0] += TOKEN_LIFETIME - webhook.TOKEN_EXPIRY_MARGIN - 1
+        assert webhook.get_bearer_token() == "a"
+    assert post.call_count == 1, "The cached token was fetched again."
+
+
+def test_bearer_token_refetched(clock):  # pylint: disable=W0621
+    """Test that a token is fetched again once it is within the margin of its
+    expiry."""
+    with token_post(access_token="a", expires_in=TOKEN_LIFETIME) as post:
+        webhook.get_bearer_token()
+        clock[0] += TOKEN_LIFETIME - webhook.TOKEN_EXPIRY_MARGIN
+        webhook.get_bearer_token()
+    assert post.call_count == 2, "The expiring token was not fetched again."
+
+
+def test_bearer_token_without_lifetime(
+    clock,
+):  # pylint: disable=W0613,W0621
+    """Test that a token without expires_in is not cached."""
+    with token_post(access_token="a") as post:
+        webhook.get_bearer_token()
+        webhook.get_bearer_token()
+    assert post.call_count == 2, "A token without a lifetime was cached."
+
+
+def drop_customer(order):
+    """Removes the customer of an order."""
+    del order["customer"]
+
+
+def null_items(order):
+    """Replaces the items of an order with null."""
+    order["items"] = None
+
+
+def drop_modifiers(order):
+    """Removes the modifiers of the first item of an order."""
+    del order["items"][0]["modifiers"]
+
+
+def drop_modifier_price(order):
+    """Removes the total price of the first modifier of an order."""
+    del order["items"][0]["modifiers"][0]["total_price"]
+
+
+def truncate_status_log(order):
+    """Keeps only the first entry of the status log of an order."""
+    del order["status_log"][1:]
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        drop_customer,
+        null_items,
+        drop_modifiers,
+        drop_modifier_price,
+        truncate_status_log,
+    ],
+)
+def test_invalid_payload(order_data: dict, corrupt):
+    """Test that a status update whose order cannot be stored is rejected
+    before its status is synced."""
+    order = json.loads(json.dumps(order_data))
+    order["customer"] = {
+        "first_name": "Test",
+        "contact_number": "+440000000000",
+        "contact_access_code": "000000",
+    }
+    order["location_id"] = 1
+    corrupt(order)
+    with mock.patch.object(webhook.sync_executor, "submit") as submit:
+        response = webhook.app.test_client().post(
+            "/prod-webhook",
+            json={"event": "order.status_update", "body": {"order": order}},
+        )
+    assert response.status_code == 400, "The payload was not rejected."
+    assert not submit.called, "The status of the payload was synced."
+
+
+def test_canceled_partial_payload(order_data: dict):
+    """Test that a canceled status update, which is synced but not written,
+    does not need the fields that only writing the order reads."""
+    order = json.loads(json.dumps(order_data))
+    order["status"] = "canceled"
+    order.pop("customer", None)
+    order.pop("location_id", None)
+    truncate_status_log(order)
+    with mock.patch.object(webhook.sync_executor, "submit") as submit:
+        response = webhook.app.test_client().post(
+            "/prod-webhook",
+            json={"event": "order.status_update", "body": {"order": order}},
+        )
+    assert response.status_code == 200, "The cancellation was rejected."
+    assert submit.called, "The status of the cancellation was not synced."